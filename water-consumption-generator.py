@@ -3,14 +3,150 @@ import pandas as pd
 import numpy as np
 import json
 import argparse
-from datetime import datetime, timedelta
+import concurrent.futures
+import os
+from collections import namedtuple
+from datetime import datetime
 import logging
-from pathlib import Path
-import random
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
+def _resolve_markov_states(state_draws, p_switch):
+    """Resolve the zero/non-zero Markov chain from pre-drawn uniforms.
+
+    p_switch[s] is the probability of leaving state s, so each step is the
+    branchless update next = prev ^ (u < p_switch[prev]).
+    """
+    num_periods = state_draws.shape[0]
+    states = np.empty(num_periods, dtype=np.uint8)
+    current_state = np.uint8(0)
+    for i in range(num_periods):
+        current_state = current_state ^ np.uint8(state_draws[i] < p_switch[current_state])
+        states[i] = current_state
+    return states
+
+# Compile the state machine to native code when numba is available; the
+# pure-Python version above is the fallback
+if njit is not None:
+    _resolve_markov_states = njit(cache=True, fastmath=True)(_resolve_markov_states)
+
+# Structure-of-arrays view of the patterns JSON: one row per cluster,
+# mixtures padded to a common component count with zero weights
+PatternTables = namedtuple('PatternTables', [
+    'cluster_index',     # cluster key -> row
+    'p_switch',          # [C, 2] P(leaving the current zero/non-zero state)
+    'has_gmm',           # bool[C]
+    'means',             # [C, K] GMM component means
+    'stds',              # [C, K] GMM component std-devs
+    'weights_cum',       # [C, K] cumulative GMM component weights
+    'temporal_factors'   # [C, 7, 24] effective (day, hour) factors
+])
+
+def preload_patterns(pattern_file):
+    """Transcode the nested patterns JSON into contiguous NumPy tables."""
+    with open(pattern_file, 'r') as f:
+        patterns = json.load(f)['patterns']
+
+    cluster_index = {key: row for row, key in enumerate(patterns)}
+    num_clusters = len(cluster_index)
+    num_components = max((len(c['gmm']['means']) for c in patterns.values()
+                          if c.get('gmm') is not None), default=1)
+
+    # float32 is plenty for values that end up rounded to 2 decimals, and
+    # halves the bandwidth of the hot arrays; the cumulative weights stay
+    # float64 so the searchsorted boundaries are exact
+    p_switch = np.full((num_clusters, 2), 0.5, dtype=np.float32)
+    has_gmm = np.zeros(num_clusters, dtype=bool)
+    means = np.zeros((num_clusters, num_components), dtype=np.float32)
+    stds = np.zeros((num_clusters, num_components), dtype=np.float32)
+    temporal_factors = np.ones((num_clusters, 7, 24), dtype=np.float32)
+
+    weights = np.zeros_like(means, dtype=np.float64)
+
+    for key, cluster_patterns in patterns.items():
+        row = cluster_index[key]
+        transitions = cluster_patterns.get('transitions', {})
+        p_switch[row, 0] = transitions.get('0', {'1': 0.5}).get('1', 0.5)
+        p_switch[row, 1] = transitions.get('1', {'0': 0.5}).get('0', 0.5)
+
+        gmm_params = cluster_patterns.get('gmm')
+        if gmm_params is None:
+            continue
+        has_gmm[row] = True
+
+        # Shorter mixtures keep their zero-weight padding on the right
+        k = len(gmm_params['means'])
+        means[row, :k] = gmm_params['means']
+        stds[row, :k] = np.sqrt(gmm_params['covars'])
+        weights[row, :k] = gmm_params['weights']
+
+        temporal_patterns = cluster_patterns.get('temporal_patterns', {})
+        hourly_patterns = temporal_patterns.get('hourly_patterns', {})
+        weekly_patterns = temporal_patterns.get('weekly_patterns', {})
+        hourly_factors = np.array([hourly_patterns.get(str(h), {}).get('mean', 1.0)
+                                   for h in range(24)])
+        weekly_factors = np.array([weekly_patterns.get(str(d), {}).get('mean', 1.0)
+                                   for d in range(7)])
+
+        # Fold the hourly/weekly averaging into one effective (day, hour)
+        # table so the hot path does a single lookup
+        temporal_factors[row] = (hourly_factors[np.newaxis, :]
+                                 + weekly_factors[:, np.newaxis]) / 2
+
+    # Cumulative weights let sampling be a searchsorted over uniforms
+    # instead of per-call choice validation; the final boundary is pinned
+    # to 1 so a uniform draw can never index past the last component
+    weights_cum = np.cumsum(weights, axis=-1)
+    weights_cum[has_gmm, -1] = 1.0
+
+    return PatternTables(cluster_index, p_switch, has_gmm, means, stds,
+                         weights_cum, temporal_factors)
+
+# Per-worker state set up by _init_worker so each task only ships a
+# (meter_id, cluster) pair instead of the patterns or generation
+# parameters
+_worker_generator = None
+_worker_patterns = None
+_worker_grid_args = None
+
+def _init_worker(pattern_file, start_date, num_periods, time_interval):
+    """Load patterns and generation parameters once per worker process."""
+    global _worker_generator, _worker_patterns, _worker_grid_args
+    _worker_generator = WaterConsumptionGenerator()
+    _worker_patterns = preload_patterns(pattern_file)
+    _worker_grid_args = (start_date, num_periods, time_interval)
+
+def _generate_meter_task(args):
+    """Generate one meter's consumption array inside a worker process."""
+    meter_id, cluster = args
+    start_date, num_periods, time_interval = _worker_grid_args
+
+    # Seed per meter so results are reproducible and workers never contend
+    # on a shared RNG
+    rng = np.random.default_rng(meter_id)
+    return _worker_generator.generate_meter_data(
+        _worker_patterns,
+        cluster,
+        start_date,
+        num_periods,
+        time_interval,
+        rng=rng
+    )
 
 class WaterConsumptionGenerator:
     def __init__(self):
         self.logger = self._setup_logging()
+        self._time_grid_cache = {}
+        self._rng = np.random.default_rng()
         
     def _setup_logging(self):
         logging.basicConfig(
@@ -34,93 +170,74 @@ class WaterConsumptionGenerator:
         """Assign a cluster based on probability distribution."""
         clusters = list(cluster_probabilities.keys())
         probabilities = list(cluster_probabilities.values())
-        return np.random.choice(clusters, p=probabilities)
+        return self._rng.choice(clusters, p=probabilities)
 
-    def generate_consumption_state(self, current_state, transitions):
-        """Generate next consumption state (zero/non-zero) based on transition probabilities."""
-        probs = transitions.get(str(current_state), {'0': 0.5, '1': 0.5})
-        states = [int(s) for s in probs.keys()]
-        probabilities = list(probs.values())
-        return np.random.choice(states, p=probabilities)
+    def _time_grid(self, start_date, num_periods, time_interval):
+        """Build (and cache) the hour/day-of-week arrays for a timestamp grid."""
+        key = (start_date, num_periods, time_interval)
+        grid = self._time_grid_cache.get(key)
+        if grid is None:
+            date_range = pd.date_range(start=start_date, periods=num_periods,
+                                       freq=f'{time_interval}min')
+            grid = {
+                'hours': date_range.hour.to_numpy(),
+                'days_of_week': date_range.dayofweek.to_numpy()
+            }
+            self._time_grid_cache[key] = grid
+        return grid
 
-    def generate_consumption_value(self, gmm_params, temporal_patterns, hour, day_of_week):
-        """Generate consumption value using GMM and temporal patterns."""
-        try:
-            if gmm_params is None:
-                return 0
+    def generate_meter_data(self, patterns, cluster, start_date, num_periods, time_interval,
+                            rng=None):
+        """Generate a single meter's consumption values as a NumPy array.
 
-            # Select component based on weights
-            component = np.random.choice(len(gmm_params['means']), p=gmm_params['weights'])
-            
-            # Generate base value from selected component
-            base_value = np.random.normal(
-                gmm_params['means'][component],
-                np.sqrt(gmm_params['covars'][component])
-            )
-            
-            # Get temporal factors with fallback values
-            hourly_patterns = temporal_patterns.get('hourly_patterns', {})
-            weekly_patterns = temporal_patterns.get('weekly_patterns', {})
-            
-            hourly_factor = hourly_patterns.get(str(hour), {}).get('mean', 1.0)
-            weekly_factor = weekly_patterns.get(str(day_of_week), {}).get('mean', 1.0)
-            
-            # Add small random variation
-            variation = np.random.normal(0, 0.1)
-            
-            adjusted_value = max(0, base_value * (hourly_factor + weekly_factor) / 2 + variation)
-            return round(adjusted_value, 2)
-            
-        except Exception as e:
-            self.logger.error(f"Error generating consumption value: {str(e)}")
-            self.logger.error(f"GMM params: {gmm_params}")
-            self.logger.error(f"Temporal patterns: {temporal_patterns}")
-            self.logger.error(f"Hour: {hour}, Day of week: {day_of_week}")
-            return 0
-
-    def generate_meter_data(self, patterns, cluster, start_date, num_periods, time_interval):
-        """Generate synthetic data for a single meter."""
+        `patterns` is the PatternTables struct produced by preload_patterns.
+        """
         try:
-            cluster_patterns = patterns[str(cluster)]
-            current_state = 0
-            data = []
-            
-            current_time = start_date
-            for _ in range(num_periods):
-                hour = current_time.hour
-                day_of_week = current_time.weekday()
-                
-                # Determine if consumption should be zero or non-zero
-                current_state = self.generate_consumption_state(
-                    current_state,
-                    cluster_patterns.get('transitions', {'0': {'0': 0.5, '1': 0.5}})
-                )
-                
-                # Generate consumption value
-                if current_state == 0:
-                    consumption = 0
-                else:
-                    consumption = self.generate_consumption_value(
-                        cluster_patterns.get('gmm'),
-                        cluster_patterns.get('temporal_patterns', {}),
-                        hour,
-                        day_of_week
-                    )
-                
-                data.append({
-                    'TimeStamp': current_time.isoformat(),
-                    'Consumption': consumption,
-                    'Cluster': int(cluster)
-                })
-                
-                current_time += timedelta(minutes=time_interval)
-                
-            return data
+            if rng is None:
+                rng = np.random.default_rng()
+
+            row = patterns.cluster_index[str(cluster)]
+
+            # Every meter shares the same timestamp grid, so its vectorized
+            # hour/day-of-week arrays are computed once and cached
+            grid = self._time_grid(start_date, num_periods, time_interval)
+            hours = grid['hours']
+            days_of_week = grid['days_of_week']
+
+            # Resolve the zero/non-zero Markov chain from one bulk uniform
+            # draw; the serial state machine runs in the (optionally jitted)
+            # kernel
+            state_draws = rng.random(num_periods)
+            states = _resolve_markov_states(state_draws, patterns.p_switch[row])
+
+            # Draw all GMM components and base values in bulk
+            if not patterns.has_gmm[row]:
+                consumption = np.zeros(num_periods, dtype=np.float32)
+            else:
+                components = np.searchsorted(patterns.weights_cum[row],
+                                             rng.random(num_periods))
+                base_values = (patterns.means[row][components]
+                               + patterns.stds[row][components]
+                               * rng.standard_normal(num_periods, dtype=np.float32))
+
+                # Add small random variation
+                variation = (rng.standard_normal(num_periods, dtype=np.float32)
+                             * np.float32(0.1))
+
+                adjusted = (base_values
+                            * patterns.temporal_factors[row][days_of_week, hours]
+                            + variation)
+
+                # Apply the zero states as one boolean mask over the whole
+                # array rather than scattering through fancy indexing
+                consumption = np.where(states == 1, np.maximum(adjusted, 0), np.float32(0))
+
+            return consumption
             
         except Exception as e:
             self.logger.error(f"Error generating meter data: {str(e)}")
             self.logger.error(f"Cluster: {cluster}")
-            self.logger.error(f"Patterns keys: {patterns.keys()}")
+            self.logger.error(f"Known clusters: {list(patterns.cluster_index.keys())}")
             raise
 
     def generate_synthetic_data(self, pattern_file, num_meters, num_periods, 
@@ -130,41 +247,104 @@ class WaterConsumptionGenerator:
             self.logger.info("Loading patterns...")
             patterns_data = self.load_patterns(pattern_file)
             
-            all_data = []
+            # Preallocate the full consumption buffer; each successful
+            # meter writes its slice in place
+            consumption = np.empty(num_meters * num_periods, dtype=np.float32)
+            meter_ids = []
+            clusters = []
+            completed = 0
             start_datetime = datetime.fromisoformat(start_date)
+
+            # Assign clusters up front so each worker task is just a
+            # (meter_id, cluster) pair
+            tasks = [
+                (meter_id,
+                 self.assign_cluster(patterns_data['cluster_probabilities']))
+                for meter_id in range(1, num_meters + 1)
+            ]
+
+            max_workers = os.cpu_count() or 1
+            self.logger.info(f"Generating data for {num_meters} meters "
+                             f"across {max_workers} workers...")
+
+            if max_workers > 1 and num_meters > 1:
+                # Meter generation is CPU-bound, so spread it across
+                # processes; patterns are loaded once per worker by the
+                # initializer
+                with concurrent.futures.ProcessPoolExecutor(
+                        max_workers=max_workers,
+                        initializer=_init_worker,
+                        initargs=(pattern_file, start_datetime,
+                                  num_periods, time_interval)) as executor:
+                    futures = [executor.submit(_generate_meter_task, task)
+                               for task in tasks]
+                    for task, future in zip(tasks, futures):
+                        meter_id = task[0]
+                        try:
+                            consumption[completed * num_periods:
+                                        (completed + 1) * num_periods] = future.result()
+                            completed += 1
+                            meter_ids.append(meter_id)
+                            clusters.append(int(task[1]))
+
+                            if meter_id % 10 == 0:
+                                self.logger.info(f"Generated data for {meter_id} meters...")
+
+                        except Exception as e:
+                            self.logger.error(f"Error generating data for meter {meter_id}: {str(e)}")
+                            continue
+            else:
+                # Single core: skip the process pool and run in-process
+                _init_worker(pattern_file, start_datetime, num_periods,
+                             time_interval)
+                for task in tasks:
+                    meter_id = task[0]
+                    try:
+                        consumption[completed * num_periods:
+                                    (completed + 1) * num_periods] = _generate_meter_task(task)
+                        completed += 1
+                        meter_ids.append(meter_id)
+                        clusters.append(int(task[1]))
+
+                        if meter_id % 10 == 0:
+                            self.logger.info(f"Generated data for {meter_id} meters...")
+
+                    except Exception as e:
+                        self.logger.error(f"Error generating data for meter {meter_id}: {str(e)}")
+                        continue
             
-            self.logger.info(f"Generating data for {num_meters} meters...")
-            for meter_id in range(1, num_meters + 1):
-                try:
-                    # Assign cluster based on probability distribution
-                    cluster = self.assign_cluster(patterns_data['cluster_probabilities'])
-                    
-                    # Generate data for this meter
-                    meter_data = self.generate_meter_data(
-                        patterns_data['patterns'],
-                        cluster,
-                        start_datetime,
-                        num_periods,
-                        time_interval
-                    )
-                    
-                    # Add meter ID
-                    for record in meter_data:
-                        record['MeterID'] = meter_id
-                    
-                    all_data.extend(meter_data)
-                    
-                    if meter_id % 10 == 0:
-                        self.logger.info(f"Generated data for {meter_id} meters...")
-                        
-                except Exception as e:
-                    self.logger.error(f"Error generating data for meter {meter_id}: {str(e)}")
-                    continue
-            
-            # Convert to DataFrame and save
+            # Every meter shares the same timestamp grid, so the final
+            # frame can be assembled directly from key arrays -- no
+            # per-meter frames to concat
             self.logger.info("Saving generated data...")
-            df = pd.DataFrame(all_data)
-            df.to_csv(output_file, index=False)
+            if completed:
+                # One in-place SIMD rounding pass over the whole buffer
+                # instead of a call per meter
+                filled = consumption[:completed * num_periods]
+                np.round(filled, 2, out=filled)
+
+                # Keep the timestamps as datetime64 all the way to the CSV
+                # writer -- no per-row strftime, the writer formats natively
+                timestamps = pd.date_range(
+                    start=start_datetime, periods=num_periods,
+                    freq=f'{time_interval}min').values.astype('datetime64[s]')
+                df = pd.DataFrame({
+                    'TimeStamp': np.tile(timestamps, completed),
+                    'Consumption': filled,
+                    'Cluster': np.repeat(np.array(clusters, dtype=np.int64), num_periods),
+                    'MeterID': np.repeat(np.array(meter_ids, dtype=np.int64), num_periods)
+                }, copy=False)
+            else:
+                df = pd.DataFrame()
+
+            # pyarrow's CSV writer formats in native code across threads;
+            # fall back to pandas when it is not installed
+            if pa is not None:
+                pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False),
+                                output_file,
+                                pacsv.WriteOptions(quoting_style='none'))
+            else:
+                df.to_csv(output_file, index=False)
             
             self.logger.info("Data generation complete!")
             